@@ -0,0 +1,130 @@
+import os
+import sys
+import time
+import argparse
+import subprocess
+import threading
+import multiprocessing
+import requests
+
+# Measures how throughput scales as the production server (server.py) runs with 1..N workers.
+# Load comes from several client processes so the client's own GIL is not the ceiling.
+# The default endpoint signs a real LiveKit JWT (no third-party network calls).
+# For meaningful numbers, run on a host with spare cores for the client processes.
+# Usage (from backend/): python benchmarks/worker_scaling.py --max-workers 4
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_until_ready(base_url: str, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{base_url}/health", timeout=1).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"Server at {base_url} did not become ready")
+
+
+def _client_process(url: str, method: str, threads: int, duration: float, results) -> None:
+    """One load-generating process: `threads` keep-alive sessions hammering `url`."""
+    stop_at = time.monotonic() + duration
+    counts = {"ok": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def worker():
+        session = requests.Session()
+        ok = errors = 0
+        while time.monotonic() < stop_at:
+            try:
+                if session.request(method, url, timeout=10).ok:
+                    ok += 1
+                else:
+                    errors += 1
+            except requests.RequestException:
+                errors += 1
+        with lock:
+            counts["ok"] += ok
+            counts["errors"] += errors
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    results.put(counts)
+
+
+def run_load(url: str, method: str, processes: int, threads: int, duration: float) -> dict:
+    """Runs `processes` client processes for `duration` seconds and returns throughput stats."""
+    results = multiprocessing.Queue()
+    clients = [
+        multiprocessing.Process(target=_client_process, args=(url, method, threads, duration, results))
+        for _ in range(processes)
+    ]
+    start = time.monotonic()
+    for p in clients:
+        p.start()
+    totals = {"ok": 0, "errors": 0}
+    for _ in clients:
+        counts = results.get()
+        totals["ok"] += counts["ok"]
+        totals["errors"] += counts["errors"]
+    for p in clients:
+        p.join()
+    elapsed = time.monotonic() - start
+    return {**totals, "rps": totals["ok"] / elapsed}
+
+
+def benchmark(workers: int, args) -> dict:
+    env = {
+        **os.environ,
+        "WEB_CONCURRENCY": str(workers),
+        "PORT": str(args.port),
+        "AUDIO_LIBRARY_WARM_ON_STARTUP": "false",
+        # Signing needs credentials but no network; dummy ones suffice for the benchmark
+        "LIVEKIT_API_KEY": os.getenv("LIVEKIT_API_KEY", "bench-key"),
+        "LIVEKIT_API_SECRET": os.getenv("LIVEKIT_API_SECRET", "bench-secret-bench-secret-bench-secret"),
+    }
+    server = subprocess.Popen(
+        [sys.executable, "server.py"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        base_url = f"http://127.0.0.1:{args.port}"
+        wait_until_ready(base_url)
+        url = base_url + args.path
+        run_load(url, args.method, args.client_processes, args.client_threads, 1)  # warm-up
+        return run_load(url, args.method, args.client_processes, args.client_threads, args.duration)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            # Graceful shutdown hung; make sure the port is freed for the next run
+            server.kill()
+            server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark throughput of the production server from 1 to N workers.")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--path", default="/livekit/token/bench-room?user_id=bench", help="Endpoint to load")
+    parser.add_argument("--method", default="POST")
+    parser.add_argument("--client-processes", type=int, default=max(2, os.cpu_count() or 1), help="Load-generating processes")
+    parser.add_argument("--client-threads", type=int, default=8, help="Concurrent connections per client process")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of load per worker count")
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+
+    print(f"host cores: {os.cpu_count()}, client: {args.client_processes} processes x {args.client_threads} threads, {args.method} {args.path}")
+    print(f"{'workers':>8} {'req/s':>10} {'speedup':>8} {'errors':>7}")
+    baseline = None
+    for workers in range(1, args.max_workers + 1):
+        result = benchmark(workers, args)
+        baseline = baseline or result["rps"] or 1
+        print(f"{workers:>8} {result['rps']:>10.1f} {result['rps'] / baseline:>7.2f}x {result['errors']:>7}")
@@ -1,42 +1,55 @@
 import os
-from fastapi import FastAPI, HTTPException, Path, Query, UploadFile, File
+from fastapi import FastAPI, HTTPException, Path, Query, UploadFile, File, Header
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 import uvicorn
 import traceback
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 from dotenv import load_dotenv
 load_dotenv()  # This loads the .env file
 
+PLACEHOLDER_SERVICES = False
+
 try:
     from services.livekit_service import LiveKitService
     from services.gemini_service import GeminiService
     from services.eleven_labs import ElevenLabsService
 except ImportError as e:
     print(f"Warning: Could not import some services: {e}")
+    PLACEHOLDER_SERVICES = True
     # Create placeholder services for testing
     class LiveKitService:
         def generate_token(self, identity: str, room: str, **kwargs):
             return "mock-token-for-testing"
     
     class GeminiService:
-        def analyze_emotion(self, text: str):
+        def analyze_emotion(self, text: str, **kwargs):
             return "neutral"
         
-        def generate_reply(self, conversation: list, emotion: str, context: list):
+        def generate_reply(self, conversation: list, emotion: str, context: list, **kwargs):
             return "I understand how you're feeling. Let's talk about it."
     
     class ElevenLabsService:
-        def text_to_speech(self, text: str):
+        def text_to_speech(self, text: str, **kwargs):
             return b"mock-audio-data"
         
         def save_audio_to_file(self, audio_bytes: bytes, path: str):
-            pass
+            with open(path, "wb") as f:
+                f.write(audio_bytes)
+            return path
         
         def speech_to_text(self, audio_bytes: bytes):
             return "Mock transcription"
 
+from services.coalescing_service import CoalescingService, CoalescedError, coalescing_key
+from services.audio_library import AudioLibrary
+
 app = FastAPI(title="Mental Health AI Backend - Audio Calls")
 
 # Add CORS middleware
@@ -70,9 +83,66 @@ except Exception as e:
     print(f"❌ Error initializing ElevenLabs service: {e}")
     elevenlabs_service = None
 
+try:
+    from services.redis_service import RedisService
+    redis_service = RedisService()
+    print("✅ Redis service initialized successfully")
+except Exception as e:
+    print(f"❌ Error initializing Redis service: {e}")
+    redis_service = None
+
+if redis_service:
+    # Keep the client even if Redis is down right now: it reconnects on its own, every
+    # call site handles Redis errors, and the short socket timeouts bound the stall.
+    try:
+        redis_service.redis.ping()
+    except Exception as e:
+        print(f"⚠️ Redis is not reachable yet, will keep retrying per request: {e}")
+
+# Duplicate in-flight requests (client retries) share one result; Redis makes this work across workers
+coalescing_service = CoalescingService(
+    redis_client=redis_service.redis if redis_service else None
+)
+
+# Per-session limit on processed turns, shared by all workers through Redis
+PROCESS_RATE_LIMIT = int(os.getenv("PROCESS_RATE_LIMIT", 30))
+PROCESS_RATE_WINDOW = int(os.getenv("PROCESS_RATE_WINDOW", 60))
+
+# Precomputed clips for canned/fallback replies, served without calling ElevenLabs
+audio_library = AudioLibrary(tts_service=elevenlabs_service)
+
+# Upper bound on Gemini + TTS for a turn; past it the canned apology is served instead
+REPLY_DEADLINE = float(os.getenv("REPLY_DEADLINE", 10))
+reply_executor = ThreadPoolExecutor(max_workers=int(os.getenv("REPLY_WORKERS", 32)))
+
+class FallbackReply(CoalescedError):
+    """
+    Raised with a canned response (as `payload`) when the real reply failed or timed out.
+    Being an exception, it reaches in-flight duplicates but is never retained for late retries.
+    """
+    def __init__(self, response: Dict[str, str]):
+        super().__init__(response["reply_text"], payload=response)
+
+@app.on_event("startup")
+def warm_audio_library():
+    """Synthesize any missing library clips in the background so startup is not blocked."""
+    # Never warm from the placeholder TTS: its fake clips would be kept and served later
+    if not elevenlabs_service or PLACEHOLDER_SERVICES or os.getenv("AUDIO_LIBRARY_WARM_ON_STARTUP", "true").lower() != "true":
+        return
+
+    def _warm():
+        try:
+            result = audio_library.warm()
+            print(f"✅ Audio library warmed: {result}")
+        except Exception as e:
+            print(f"❌ Error warming audio library: {e}")
+
+    threading.Thread(target=_warm, daemon=True).start()
+
 # ----- Request/Response Schemas -----
 class ConversationInput(BaseModel):
     transcribed_text: str
+    voice_id: Optional[str] = None
 
 class ConversationOutput(BaseModel):
     reply_text: str
@@ -125,7 +195,6 @@ def get_livekit_token_by_room(
             room=room_id,
             can_publish_audio=True,
             can_subscribe_audio=True,
-
         )
         
         print(f"✅ Token generated successfully for user '{user_id}'")
@@ -145,10 +214,15 @@ def get_livekit_token_by_room(
 @app.post("/conversation/{session_id}/process", response_model=ConversationOutput)
 def process_conversation(
     session_id: str = Path(..., description="Session ID for the call"),
-    body: ConversationInput = ...
+    body: ConversationInput = ...,
+    idempotency_key: Optional[str] = Header(None, description="Client key identifying retries of the same turn")
 ):
     """
-    Process user speech: transcribe -> analyze -> generate reply -> convert to speech
+    Process user speech: transcribe -> analyze -> generate reply -> convert to speech.
+    Duplicates of a turn still in flight (same text, and same Idempotency-Key when one
+    is sent) share the first request's result. With an Idempotency-Key the result is
+    also kept briefly for late retries; without one, repeating the same words later
+    is a new turn.
     """
     try:
         print(f"💬 Processing conversation for session '{session_id}'")
@@ -162,34 +236,30 @@ def process_conversation(
         user_text = body.transcribed_text
         print(f"📝 User text: {user_text}")
         
-        # 1. Analyze emotion/sentiment
-        emotion = gemini_service.analyze_emotion(user_text)
-        print(f"😊 Detected emotion: {emotion}")
-        
-        # 2. Generate empathetic reply
-        reply_text = gemini_service.generate_reply([f"user: {user_text}"], emotion, [])
-        print(f"🤖 Generated reply: {reply_text}")
-        
-        # 3. Convert to speech
-        audio_bytes = elevenlabs_service.text_to_speech(reply_text)
-        
-        # 4. Save audio file
-        audio_dir = "audio_responses"
-        os.makedirs(audio_dir, exist_ok=True)
-        audio_file_path = f"{audio_dir}/{session_id}_reply.mp3"
-        elevenlabs_service.save_audio_to_file(audio_bytes, audio_file_path)
-        
-        audio_url = f"/static/{session_id}_reply.mp3"
-        
-        print(f"🎵 Audio saved to: {audio_url}")
+        voice_id = body.voice_id or audio_library.default_voice
+        if voice_id not in audio_library.voices:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Unknown voice '{voice_id}'. Available voices: {', '.join(audio_library.voices)}"
+            )
         
-        return {
-            "reply_text": reply_text, 
-            "audio_url": audio_url
-        }
+        key = coalescing_key(f"{voice_id}:{user_text}", idempotency_key)
+        return coalescing_service.run(
+            "process", session_id, key,
+            lambda: _process_turn(session_id, user_text, key, voice_id),
+            retain=bool(idempotency_key)
+        )
         
     except HTTPException:
         raise
+    except CoalescedError as e:
+        # Fallback replies carry their canned response; other shared failures keep their status
+        if e.payload:
+            return e.payload
+        raise HTTPException(
+            status_code=e.status_code or 502,
+            detail=f"Failed to process conversation: {str(e)}"
+        )
     except Exception as e:
         print(f"❌ Error processing conversation: {str(e)}")
         print(f"Traceback: {traceback.format_exc()}")
@@ -198,11 +268,162 @@ def process_conversation(
             detail=f"Failed to process conversation: {str(e)}"
         )
 
+def _process_turn(session_id: str, user_text: str, key: str, voice_id: str) -> Dict[str, Any]:
+    """Runs the upstream Gemini and ElevenLabs calls for a single conversation turn."""
+    _check_rate_limit(session_id)
+    
+    # Steps 1-3 run under a deadline so a slow or failing upstream falls back to canned audio quickly
+    deadline = time.monotonic() + REPLY_DEADLINE
+    future = reply_executor.submit(_generate_reply, session_id, user_text, voice_id, deadline)
+    try:
+        reply_text, audio_bytes = future.result(timeout=REPLY_DEADLINE)
+    except Exception as e:
+        # Drop the job if it has not started; a running one stops at its next deadline check
+        future.cancel()
+        fallback = audio_library.get_response("fallback_apology", voice_id)
+        if not fallback:
+            raise HTTPException(
+                status_code=502,
+                detail="Upstream services failed and no fallback audio is available"
+            )
+        print(f"❌ Reply failed or exceeded {REPLY_DEADLINE}s, serving fallback audio: {e!r}")
+        _save_turn(session_id, user_text, fallback["reply_text"])
+        raise FallbackReply(fallback)
+    
+    # Canned replies are served from the precomputed library
+    if audio_bytes is None:
+        canned = audio_library.lookup(reply_text, voice_id)
+        print(f"🎵 Serving precomputed audio: {canned['audio_url']}")
+        _save_turn(session_id, user_text, reply_text)
+        return canned
+    
+    # 4. Save audio file, unique per turn so a returned or retained URL never points at a later turn's audio
+    # (write to a temp file and rename so readers never see a partial mp3)
+    audio_dir = "audio_responses"
+    os.makedirs(audio_dir, exist_ok=True)
+    audio_file_name = f"{session_id}_{key[:16]}_{uuid.uuid4().hex[:8]}.mp3"
+    audio_file_path = f"{audio_dir}/{audio_file_name}"
+    tmp_file_path = f"{audio_file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    elevenlabs_service.save_audio_to_file(audio_bytes, tmp_file_path)
+    os.replace(tmp_file_path, audio_file_path)
+    
+    audio_url = f"/static/{audio_file_name}"
+    
+    print(f"🎵 Audio saved to: {audio_url}")
+    
+    # Only record the reply once it is known to be the one served
+    _save_turn(session_id, user_text, reply_text)
+    
+    return {
+        "reply_text": reply_text, 
+        "audio_url": audio_url
+    }
+
+def _remaining(deadline: float) -> float:
+    """Seconds left before `deadline`; raises once it has passed so no further upstream call is made."""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError("Reply deadline passed")
+    return remaining
+
+def _generate_reply(session_id: str, user_text: str, voice_id: str, deadline: float) -> Tuple[str, Optional[bytes]]:
+    """
+    Generates the reply text and its audio. Returns (reply_text, audio_bytes), where
+    audio_bytes is None when the reply matches a precomputed library phrase.
+    Each upstream call gets the time left before `deadline` as its request timeout,
+    so work abandoned by the caller stops soon after the deadline instead of paying for TTS.
+    """
+    # 1. Analyze emotion/sentiment
+    emotion = gemini_service.analyze_emotion(user_text, timeout=_remaining(deadline))
+    print(f"😊 Detected emotion: {emotion}")
+    
+    # 2. Generate empathetic reply using the session history shared in Redis
+    history = _get_history(session_id)
+    reply_text = gemini_service.generate_reply(
+        history + [f"user: {user_text}"], emotion, [], timeout=_remaining(deadline)
+    )
+    print(f"🤖 Generated reply: {reply_text}")
+    
+    # Gemini returns "" on any upstream error
+    if not reply_text or not reply_text.strip():
+        raise RuntimeError("Gemini returned an empty reply")
+    
+    if audio_library.lookup(reply_text, voice_id):
+        return reply_text, None
+    
+    # 3. Convert to speech
+    return reply_text, elevenlabs_service.text_to_speech(
+        reply_text, voice_id=voice_id, timeout=_remaining(deadline)
+    )
+
+def _check_rate_limit(session_id: str) -> None:
+    """Raise 429 once a session exceeds its turn limit; allow requests if Redis is unavailable."""
+    if not redis_service:
+        return
+    try:
+        allowed = redis_service.check_rate_limit("process", session_id, PROCESS_RATE_LIMIT, PROCESS_RATE_WINDOW)
+    except Exception as e:
+        print(f"❌ Rate limit check failed, allowing request: {e}")
+        return
+    if not allowed:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many requests for session '{session_id}'. Please slow down."
+        )
+
+def _get_history(session_id: str) -> list:
+    """Recent messages for a session, or an empty list if Redis is unavailable."""
+    if not redis_service:
+        return []
+    try:
+        return redis_service.get_recent_messages(session_id)
+    except Exception as e:
+        print(f"❌ Error loading session history: {e}")
+        return []
+
+def _save_turn(session_id: str, user_text: str, reply_text: str) -> None:
+    if not redis_service:
+        return
+    try:
+        redis_service.add_message(session_id, f"user: {user_text}")
+        redis_service.add_message(session_id, f"ai: {reply_text}")
+    except Exception as e:
+        print(f"❌ Error saving session history: {e}")
+
+# ----- Acknowledgement Endpoint -----
+@app.get("/conversation/{session_id}/ack", response_model=ConversationOutput)
+def get_acknowledgement(
+    session_id: str = Path(..., description="Session ID for the call"),
+    voice_id: Optional[str] = Query(None, description="Voice of the acknowledgement clip")
+):
+    """
+    Return a precomputed acknowledgement ("Take your time", ...) the client can play
+    immediately while the real reply is still being generated.
+    """
+    if voice_id and voice_id not in audio_library.voices:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unknown voice '{voice_id}'. Available voices: {', '.join(audio_library.voices)}"
+        )
+    ack = audio_library.random_response("acknowledgement", voice_id)
+    if not ack:
+        raise HTTPException(
+            status_code=503,
+            detail="Audio library has not been warmed yet"
+        )
+    return ack
+
 # ----- Audio Transcription Endpoint -----
 @app.post("/elevenlabs/transcribe")
-async def transcribe_audio(file: UploadFile = File(...)):
+async def transcribe_audio(
+    file: UploadFile = File(...),
+    session_id: str = Query(..., description="Session ID for the call"),
+    idempotency_key: Optional[str] = Header(None, description="Client key identifying retries of the same upload")
+):
     """
     Transcribe audio using ElevenLabs Speech-to-Text.
+    Duplicates of an upload still in flight share the first request's result;
+    with an Idempotency-Key it is also kept briefly for late retries.
     """
     try:
         print(f"🎤 Transcribing audio file: {file.filename}")
@@ -214,7 +435,14 @@ async def transcribe_audio(file: UploadFile = File(...)):
             )
         
         audio_bytes = await file.read()
-        text = elevenlabs_service.speech_to_text(audio_bytes)
+        # Hash off the event loop; hashlib releases the GIL on large buffers
+        key = await run_in_threadpool(coalescing_key, audio_bytes, idempotency_key)
+        text = await run_in_threadpool(
+            coalescing_service.run,
+            "transcribe", session_id, key,
+            lambda: elevenlabs_service.speech_to_text(audio_bytes),
+            retain=bool(idempotency_key)
+        )
         
         print(f"📝 Transcription result: {text}")
         return {"text": text}
@@ -247,6 +475,12 @@ def debug_environment():
         "python_path": os.getenv("PYTHONPATH", "Not set"),
     }
 
+@app.get("/debug/coalescing")
+def debug_coalescing():
+    """Counts of upstream calls saved by coalescing duplicate requests"""
+    return coalescing_service.stats()
+
+# Development server with auto-reload; use `python server.py` for multi-worker production mode
 if __name__ == "__main__":
     print("🚀 Starting Mental Health AI Backend...")
     print("📋 Environment check:")
@@ -0,0 +1,53 @@
+import os
+import uvicorn
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# Production launcher: several worker processes, no auto-reload.
+# Shared state (session history, rate limits, coalesced results) lives in Redis,
+# so any worker can serve any request. The audio library is warmed once here,
+# before the workers start.
+#
+# Graceful restarts: send SIGHUP to the supervisor process to replace workers one
+# at a time (e.g. after a deploy); SIGTERM lets in-flight requests finish for up
+# to GRACEFUL_TIMEOUT seconds before exiting.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+KEEPALIVE_TIMEOUT = int(os.getenv("KEEPALIVE_TIMEOUT", 5))
+
+
+def warm_audio_library():
+    """
+    Synthesize missing library clips once, before the workers start, instead of
+    letting every worker race to make the same paid TTS calls.
+    """
+    try:
+        from services.eleven_labs import ElevenLabsService
+        from services.audio_library import AudioLibrary
+        result = AudioLibrary(tts_service=ElevenLabsService()).warm()
+        print(f"✅ Audio library warmed: {result}")
+    except Exception as e:
+        print(f"❌ Error warming audio library: {e}")
+
+
+if __name__ == "__main__":
+    print(f"🚀 Starting Mental Health AI Backend with {WEB_CONCURRENCY} workers...")
+    print(f"   REDIS_URL: {'✅ Set' if os.getenv('REDIS_URL') else '❌ Not set (using default)'}")
+
+    if os.getenv("AUDIO_LIBRARY_WARM_ON_STARTUP", "true").lower() == "true":
+        warm_audio_library()
+    # Workers inherit the environment; the library is already warm
+    os.environ["AUDIO_LIBRARY_WARM_ON_STARTUP"] = "false"
+
+    uvicorn.run(
+        "main:app",
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", 8000)),
+        workers=WEB_CONCURRENCY,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        timeout_keep_alive=KEEPALIVE_TIMEOUT,
+        proxy_headers=True,
+        log_level="info"
+    )
@@ -0,0 +1,180 @@
+import os
+import random
+import threading
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+# Where precomputed clips live; served under /static/library/{voice_id}/{phrase_id}.mp3
+AUDIO_LIBRARY_DIR = os.getenv("AUDIO_LIBRARY_DIR", os.path.join("audio_responses", "library"))
+# Voice used for replies when the client does not pick one; always part of the library
+DEFAULT_VOICE = os.getenv("TTS_VOICE_ID", "Rachel")
+AUDIO_LIBRARY_VOICES = [v.strip() for v in os.getenv("AUDIO_LIBRARY_VOICES", DEFAULT_VOICE).split(",") if v.strip()]
+AUDIO_LIBRARY_WORKERS = int(os.getenv("AUDIO_LIBRARY_WORKERS", 4))
+
+# Common phrases synthesized ahead of time, grouped by category: {category: {phrase_id: text}}
+PHRASES: Dict[str, Dict[str, str]] = {
+    "greeting": {
+        "greeting_hello": "Hi, I'm here with you. How are you feeling today?",
+        "greeting_welcome_back": "Welcome back. It's good to hear from you again.",
+    },
+    "fallback": {
+        "fallback_apology": "I'm sorry, I'm having a little trouble right now. Could you say that again?",
+        "fallback_still_here": "I'm still here with you. Give me a moment and let's keep talking.",
+        "fallback_placeholder": "I understand how you're feeling. Let's talk about it.",
+    },
+    "grounding": {
+        "grounding_breath": "Let's take a slow breath together. Breathe in for four, hold for four, and breathe out for four.",
+        "grounding_senses": "Try noticing five things you can see, four you can touch, three you can hear, two you can smell, and one you can taste.",
+    },
+    "acknowledgement": {
+        "ack_take_your_time": "Take your time.",
+        "ack_listening": "I'm listening.",
+        "ack_thinking": "Thank you for sharing that. Let me think about it for a moment.",
+    },
+}
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+class AudioLibrary:
+    """
+    Library of precomputed TTS clips for canned and fallback responses.
+    Clips are synthesized in bulk per voice and then served from disk without
+    calling ElevenLabs, so they are available instantly even when upstream fails.
+    """
+
+    def __init__(
+        self,
+        tts_service=None,
+        library_dir: Optional[str] = None,
+        voices: Optional[List[str]] = None,
+        phrases: Optional[Dict[str, Dict[str, str]]] = None,
+        default_voice: Optional[str] = None,
+    ):
+        self.tts_service = tts_service
+        self.library_dir = library_dir or AUDIO_LIBRARY_DIR
+        self.default_voice = default_voice or DEFAULT_VOICE
+        # The default voice is always warmed so lookups without a voice can be served
+        self.voices = list(dict.fromkeys([self.default_voice] + (voices or AUDIO_LIBRARY_VOICES)))
+        self.phrases = phrases or PHRASES
+        self._texts = {
+            phrase_id: text
+            for category in self.phrases.values()
+            for phrase_id, text in category.items()
+        }
+        self._by_text = {_normalize(text): phrase_id for phrase_id, text in self._texts.items()}
+
+    def get_path(self, phrase_id: str, voice_id: Optional[str] = None) -> str:
+        """Returns the on-disk path of a clip."""
+        voice_id = voice_id or self.default_voice
+        return os.path.join(self.library_dir, voice_id, f"{phrase_id}.mp3")
+
+    def get_url(self, phrase_id: str, voice_id: Optional[str] = None) -> str:
+        """Returns the static URL of a clip."""
+        voice_id = voice_id or self.default_voice
+        return f"/static/library/{voice_id}/{phrase_id}.mp3"
+
+    def get_text(self, phrase_id: str) -> str:
+        """Returns the text of a phrase."""
+        return self._texts[phrase_id]
+
+    def get_response(self, phrase_id: str, voice_id: Optional[str] = None) -> Optional[Dict[str, str]]:
+        """
+        Returns {"reply_text", "audio_url"} for a phrase whose clip has been synthesized,
+        or None if the phrase is unknown or not yet warmed.
+        """
+        if voice_id and voice_id not in self.voices:
+            return None
+        if phrase_id not in self._texts or not os.path.exists(self.get_path(phrase_id, voice_id)):
+            return None
+        return {
+            "reply_text": self._texts[phrase_id],
+            "audio_url": self.get_url(phrase_id, voice_id),
+        }
+
+    def lookup(self, text: str, voice_id: Optional[str] = None) -> Optional[Dict[str, str]]:
+        """Returns the precomputed response for text matching a library phrase, if available."""
+        phrase_id = self._by_text.get(_normalize(text or ""))
+        return self.get_response(phrase_id, voice_id) if phrase_id else None
+
+    def random_response(self, category: str, voice_id: Optional[str] = None) -> Optional[Dict[str, str]]:
+        """Returns a random warmed response from a category, or None if none are available."""
+        phrase_ids = list(self.phrases.get(category, {}))
+        random.shuffle(phrase_ids)
+        for phrase_id in phrase_ids:
+            response = self.get_response(phrase_id, voice_id)
+            if response:
+                return response
+        return None
+
+    def warm(self, rebuild: bool = False, max_workers: int = AUDIO_LIBRARY_WORKERS) -> Dict[str, int]:
+        """
+        Synthesizes every (voice, phrase) clip in parallel.
+        Existing clips are skipped unless `rebuild` is True.
+        Returns counts of synthesized, skipped and failed clips.
+        """
+        if self.tts_service is None:
+            raise ValueError("A TTS service is required to warm the audio library")
+
+        jobs = []
+        skipped = 0
+        for voice_id in self.voices:
+            os.makedirs(os.path.join(self.library_dir, voice_id), exist_ok=True)
+            for phrase_id in self._texts:
+                if not rebuild and os.path.exists(self.get_path(phrase_id, voice_id)):
+                    skipped += 1
+                    continue
+                jobs.append((phrase_id, voice_id))
+
+        synthesized = failed = 0
+        if jobs:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                futures = {
+                    pool.submit(self._synthesize, phrase_id, voice_id): (phrase_id, voice_id)
+                    for phrase_id, voice_id in jobs
+                }
+                for future in as_completed(futures):
+                    phrase_id, voice_id = futures[future]
+                    try:
+                        future.result()
+                        synthesized += 1
+                    except Exception as e:
+                        failed += 1
+                        print(f"Error synthesizing '{phrase_id}' for voice '{voice_id}': {e}")
+
+        return {"synthesized": synthesized, "skipped": skipped, "failed": failed}
+
+    def _synthesize(self, phrase_id: str, voice_id: str) -> str:
+        path = self.get_path(phrase_id, voice_id)
+        audio_bytes = self.tts_service.text_to_speech(self._texts[phrase_id], voice_id=voice_id)
+        # Write to a temp file unique to this process/thread and rename so a half-written clip is never served
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio_bytes)
+        os.replace(tmp_path, path)
+        return path
+
+
+# CLI: python -m services.audio_library warm|rebuild [--voices Rachel,Bella] [--workers 8]
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    from services.eleven_labs import ElevenLabsService
+
+    parser = argparse.ArgumentParser(description="Warm or rebuild the precomputed audio library.")
+    parser.add_argument("command", choices=["warm", "rebuild"], help="warm: synthesize missing clips; rebuild: resynthesize all clips")
+    parser.add_argument("--voices", default=",".join(AUDIO_LIBRARY_VOICES), help="Comma-separated ElevenLabs voice IDs")
+    parser.add_argument("--workers", type=int, default=AUDIO_LIBRARY_WORKERS, help="Parallel TTS requests")
+    parser.add_argument("--dir", default=AUDIO_LIBRARY_DIR, help="Library output directory")
+    args = parser.parse_args()
+
+    library = AudioLibrary(
+        tts_service=ElevenLabsService(),
+        library_dir=args.dir,
+        voices=[v.strip() for v in args.voices.split(",") if v.strip()],
+    )
+    result = library.warm(rebuild=args.command == "rebuild", max_workers=args.workers)
+    print(f"Audio library {args.command}: {result}")
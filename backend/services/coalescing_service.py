@@ -0,0 +1,337 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# How long a finished result is kept around for late retries, and how long a
+# worker may hold the cross-process lock before it is considered dead.
+# The lock TTL and wait timeout must exceed the worst-case upstream time of a turn
+# (two Gemini calls at 20s each plus TTS at 30s), or a second worker would repeat
+# the calls and waiters would time out while the leader is still working.
+COALESCE_RESULT_TTL = int(os.getenv("COALESCE_RESULT_TTL", 30))
+COALESCE_LOCK_TTL = int(os.getenv("COALESCE_LOCK_TTL", 120))
+COALESCE_WAIT_TIMEOUT = float(os.getenv("COALESCE_WAIT_TIMEOUT", 120))
+COALESCE_POLL_INTERVAL = float(os.getenv("COALESCE_POLL_INTERVAL", 0.1))
+# How long a leader's outcome (result or error) stays readable by workers that were
+# waiting on its lock; long enough for them to notice the lock release.
+COALESCE_OUTCOME_TTL = int(os.getenv("COALESCE_OUTCOME_TTL", 10))
+
+# Deletes the lock only if it is still owned by the caller's token.
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+else
+    return 0
+end
+"""
+
+
+def content_hash(data) -> str:
+    """
+    Returns a stable SHA-256 hex digest for request content (text or bytes).
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def coalescing_key(content, idempotency_key: Optional[str] = None) -> str:
+    """
+    Returns the coalescing key for a request: the content hash, bound to the
+    client's idempotency key when one is sent. A reused idempotency key with a
+    different body therefore never matches another request's result.
+    """
+    if not idempotency_key:
+        return content_hash(content)
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return content_hash(idempotency_key.encode("utf-8") + b"\0" + content)
+
+
+class CoalescedError(Exception):
+    """
+    A failure shared with duplicate requests. Raise it (or a subclass) from the
+    coalesced call to hand waiters a JSON-serializable `payload`, such as a
+    fallback response; workers waiting on another process receive it as this class.
+    """
+
+    def __init__(self, message: str, payload: Any = None, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.payload = payload
+        self.status_code = status_code
+
+
+class _Flight:
+    """A single in-flight call that duplicate requests in this process wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class CoalescingService:
+    """
+    Single-flight request coalescing keyed by (namespace, session_id, key).
+
+    Duplicate requests arriving while the first one is still running wait on
+    the same outcome instead of repeating the upstream calls. Within a process
+    this uses a shared in-flight table; across workers it uses a Redis lock and
+    a short-lived outcome record tied to the lock owner. With `retain=True`
+    successful results are also kept for `result_ttl` seconds so late retries
+    are answered without doing the work again.
+
+    Results must be JSON-serializable. If Redis is unavailable the service
+    degrades to in-process coalescing only.
+    """
+
+    def __init__(
+        self,
+        redis_client=None,
+        result_ttl: int = COALESCE_RESULT_TTL,
+        lock_ttl: int = COALESCE_LOCK_TTL,
+        wait_timeout: float = COALESCE_WAIT_TIMEOUT,
+        poll_interval: float = COALESCE_POLL_INTERVAL,
+        outcome_ttl: int = COALESCE_OUTCOME_TTL,
+    ):
+        self.redis = redis_client
+        self.result_ttl = result_ttl
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.outcome_ttl = outcome_ttl
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, _Flight] = {}
+        self._results: Dict[str, Tuple[float, Any]] = {}
+        self._local_saved = 0
+
+    # ----- Keys -----
+    def get_base_key(self, namespace: str, session_id: str, key: str) -> str:
+        """Returns the Redis key prefix for a coalesced call."""
+        return f"coalesce:{namespace}:{session_id}:{key}"
+
+    def get_stats_key(self) -> str:
+        """Returns the Redis key counting upstream calls saved across workers."""
+        return "coalesce:stats:saved"
+
+    # ----- Public API -----
+    def run(self, namespace: str, session_id: str, key: str, fn: Callable[[], Any], retain: bool = True) -> Any:
+        """
+        Runs `fn` once per (namespace, session_id, key) and shares its outcome
+        with every duplicate request that arrives while it is in flight.
+        With `retain`, a successful result is also returned to duplicates
+        arriving within `result_ttl` seconds after it completes; only use it
+        when the key identifies a single request (e.g. a client idempotency key).
+        Exceptions are shared with in-flight waiters but never retained.
+        """
+        base_key = self.get_base_key(namespace, session_id, key)
+
+        if retain:
+            found, result = self._get_cached(base_key)
+            if found:
+                self._record_saved(base_key)
+                return result
+
+        with self._lock:
+            flight = self._inflight.get(base_key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._inflight[base_key] = flight
+
+        if not leader:
+            if not flight.done.wait(self.wait_timeout):
+                raise TimeoutError(f"Timed out waiting for in-flight request {base_key}")
+            if flight.error is not None:
+                raise flight.error
+            self._record_saved(base_key)
+            return flight.result
+
+        try:
+            flight.result = self._run_leader(base_key, fn, retain)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(base_key, None)
+            flight.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns coalescing counters: upstream calls saved by this process,
+        across all workers (when Redis is available), and current in-flight calls.
+        """
+        saved_total = None
+        if self.redis is not None:
+            try:
+                saved_total = int(self.redis.get(self.get_stats_key()) or 0)
+            except Exception as e:
+                print(f"Coalescing stats unavailable from Redis: {e}")
+        with self._lock:
+            inflight = len(self._inflight)
+        return {
+            "saved_local": self._local_saved,
+            "saved_total": saved_total,
+            "inflight": inflight,
+        }
+
+    # ----- Internals -----
+    def _run_leader(self, base_key: str, fn: Callable[[], Any], retain: bool) -> Any:
+        """
+        Runs `fn` for the first request in this process, coordinating with
+        other workers through a Redis lock when one is configured.
+        """
+        lock_key = f"{base_key}:lock"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.wait_timeout
+        acquired = self._acquire_lock(lock_key, token)
+
+        while acquired is False:
+            # Another worker owns this call; wait for it to publish its outcome.
+            outcome = self._wait_for_remote(base_key, lock_key, deadline, retain)
+            if outcome is not None:
+                self._record_saved(base_key)
+                if "result" in outcome:
+                    return outcome["result"]
+                raise CoalescedError(outcome["error"], outcome.get("payload"), outcome.get("status_code"))
+            # The owner died without an outcome; try to take over the call.
+            # If yet another worker got the lock first, go back to waiting on it.
+            acquired = self._acquire_lock(lock_key, token)
+
+        try:
+            result = fn()
+        except Exception as e:
+            if acquired:
+                self._publish_outcome(base_key, token, {
+                    "error": str(getattr(e, "detail", None) or e),
+                    "payload": e.payload if isinstance(e, CoalescedError) else None,
+                    "status_code": getattr(e, "status_code", None),
+                })
+                self._release_lock(lock_key, token)
+            raise
+        if retain:
+            self._store_result(base_key, result)
+        if acquired:
+            self._publish_outcome(base_key, token, {"result": result})
+            self._release_lock(lock_key, token)
+        return result
+
+    def _acquire_lock(self, lock_key: str, token: str) -> Optional[bool]:
+        """Returns True/False for the lock outcome, or None when Redis is unavailable."""
+        if self.redis is None:
+            return None
+        try:
+            return bool(self.redis.set(lock_key, token, nx=True, ex=self.lock_ttl))
+        except Exception as e:
+            print(f"Coalescing lock unavailable, using local coalescing only: {e}")
+            return None
+
+    def _release_lock(self, lock_key: str, token: str) -> None:
+        try:
+            self.redis.eval(_RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+        except Exception as e:
+            print(f"Error releasing coalescing lock {lock_key}: {e}")
+
+    def _wait_for_remote(self, base_key: str, lock_key: str, deadline: float, retain: bool) -> Optional[Dict[str, Any]]:
+        """
+        Polls for the outcome of the worker currently holding the lock until it
+        appears or the lock changes hands. Returns None if the owner left no outcome.
+        """
+        try:
+            owner = self.redis.get(lock_key)
+            if owner is None:
+                # Released before we looked; only a retained result may answer us now.
+                found, result = self._get_remote(base_key) if retain else (False, None)
+                return {"result": result} if found else None
+            while time.monotonic() < deadline:
+                outcome = self._get_outcome(base_key, owner)
+                if outcome is not None:
+                    return outcome
+                if self.redis.get(lock_key) != owner:
+                    return self._get_outcome(base_key, owner)
+                time.sleep(self.poll_interval)
+        except Exception as e:
+            print(f"Error waiting on coalescing lock {lock_key}: {e}")
+            return None
+        raise TimeoutError(f"Timed out waiting for in-flight request {base_key}")
+
+    def _get_outcome(self, base_key: str, token: str) -> Optional[Dict[str, Any]]:
+        raw = self.redis.get(f"{base_key}:outcome:{token}")
+        return json.loads(raw) if raw is not None else None
+
+    def _publish_outcome(self, base_key: str, token: str, outcome: Dict[str, Any]) -> None:
+        """Makes the leader's outcome readable by workers waiting on its lock (set before release)."""
+        try:
+            self.redis.set(f"{base_key}:outcome:{token}", json.dumps(outcome), ex=self.outcome_ttl)
+        except Exception as e:
+            print(f"Error publishing coalesced outcome {base_key}: {e}")
+
+    def _get_cached(self, base_key: str) -> Tuple[bool, Any]:
+        """Looks up a retained result, first in this process and then in Redis."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._results.get(base_key)
+            if entry is not None:
+                expires_at, result = entry
+                if expires_at > now:
+                    return True, result
+                del self._results[base_key]
+        return self._get_remote(base_key)
+
+    def _get_remote(self, base_key: str) -> Tuple[bool, Any]:
+        if self.redis is None:
+            return False, None
+        try:
+            raw = self.redis.get(f"{base_key}:result")
+        except Exception as e:
+            print(f"Error reading coalesced result {base_key}: {e}")
+            return False, None
+        if raw is None:
+            return False, None
+        return True, json.loads(raw)
+
+    def _store_result(self, base_key: str, result: Any) -> None:
+        now = time.monotonic()
+        with self._lock:
+            # Drop expired entries so the local table stays bounded by the TTL.
+            for k in [k for k, (exp, _) in self._results.items() if exp <= now]:
+                del self._results[k]
+            self._results[base_key] = (now + self.result_ttl, result)
+        if self.redis is None:
+            return
+        try:
+            self.redis.set(f"{base_key}:result", json.dumps(result), ex=self.result_ttl)
+        except Exception as e:
+            print(f"Error storing coalesced result {base_key}: {e}")
+
+    def _record_saved(self, base_key: str) -> None:
+        with self._lock:
+            self._local_saved += 1
+        print(f"♻️ Coalesced duplicate request {base_key}")
+        if self.redis is None:
+            return
+        try:
+            self.redis.incr(self.get_stats_key())
+        except Exception as e:
+            print(f"Error updating coalescing stats: {e}")
+
+
+# Example usage for local testing
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    service = CoalescingService()
+
+    def slow_call():
+        time.sleep(1)
+        return {"value": 42}
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        futures = [pool.submit(service.run, "demo", "session", "key", slow_call) for _ in range(5)]
+        print([f.result() for f in futures])
+    print("Stats:", service.stats())
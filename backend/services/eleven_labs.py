@@ -24,7 +24,8 @@ class ElevenLabsService:
         text: str,
         voice_id: str = "Rachel",
         model_id: str = "eleven_multilingual_v2",
-        output_format: str = "mp3"
+        output_format: str = "mp3",
+        timeout: float = 30
     ) -> bytes:
         """
         Convert text to speech using ElevenLabs TTS API.
@@ -40,7 +41,7 @@ class ElevenLabsService:
             url,
             json=payload,
             headers={**self.headers, "Content-Type": "application/json"},
-            timeout=30
+            timeout=timeout
         )
         response.raise_for_status()
         return response.content
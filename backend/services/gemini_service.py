@@ -24,7 +24,7 @@ class GeminiService:
             "x-goog-api-key": self.api_key
         }
 
-    def analyze_emotion(self, text: str) -> str:
+    def analyze_emotion(self, text: str, timeout: float = 20) -> str:
         """
         Analyze the user's emotion from input text using Gemini.
         Returns a single-word emotion label in lowercase.
@@ -34,10 +34,12 @@ class GeminiService:
             "(e.g., angry, sad, happy, neutral, anxious, etc.):\n\n"
             f"{text}"
         )
-        response = self._call_gemini(prompt)
+        response = self._call_gemini(prompt, timeout=timeout)
         return response.strip().lower()
 
-    def generate_reply(self, conversation: List[str], emotion: str, memories: List[Dict[str, Any]]) -> str:
+    def generate_reply(
+        self, conversation: List[str], emotion: str, memories: List[Dict[str, Any]], timeout: float = 20
+    ) -> str:
         """
         Generate an empathetic reply based on conversation history, detected emotion, and relevant memories.
         - conversation: list of recent utterances (["user: ...", "ai: ...", ...])
@@ -52,7 +54,7 @@ class GeminiService:
             f"Relevant past memories:\n{memory_summaries}\n"
             "Reply in a way that is supportive, non-judgmental, and encourages the user to share more if they wish."
         )
-        return self._call_gemini(prompt)
+        return self._call_gemini(prompt, timeout=timeout)
 
     def get_embedding(self, text: str) -> List[float]:
         """
@@ -63,7 +65,7 @@ class GeminiService:
         VECTOR_DIM = 1536
         return np.random.rand(VECTOR_DIM).astype(float).tolist()
 
-    def _call_gemini(self, prompt: str) -> str:
+    def _call_gemini(self, prompt: str, timeout: float = 20) -> str:
         """
         Send a prompt to Gemini and return the generated text response.
         Handles API errors gracefully.
@@ -77,14 +79,15 @@ class GeminiService:
                 }
             ]
         }
-        resp = requests.post(
-            self.api_url,
-            headers={"Content-Type": "application/json"},
-            params={"key": self.api_key},
-            json=payload,
-            timeout=20
-        )
+        resp = None
         try:
+            resp = requests.post(
+                self.api_url,
+                headers={"Content-Type": "application/json"},
+                params={"key": self.api_key},
+                json=payload,
+                timeout=timeout
+            )
             resp.raise_for_status()
             data = resp.json()
             # Extract the generated text from Gemini's response
@@ -93,7 +96,7 @@ class GeminiService:
                 if data.get("candidates") else ""
             )
         except Exception as e:
-            print(f"Gemini API error: {e} | Response: {resp.text}")
+            print(f"Gemini API error: {e} | Response: {resp.text if resp is not None else 'no response'}")
             return ""
 
 # Example usage for local development/testing